@@ -3,18 +3,28 @@ from __future__ import annotations
 
 import asyncio
 import base64
-import hashlib
 import logging
 import re
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import aiohttp
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from homeassistant.helpers.json import json_bytes
+from homeassistant.util.json import json_loads
 
 from .const import API_BASE_URL, CALLS_URL, LOGIN_URL, SALT_URL
 
 _LOGGER = logging.getLogger(__name__)
 
+# Pre-encoded login request bodies; only the per-call values are spliced in
+_SALT_TEMPLATE = b'{"emailOrUsername":%b,"mobileApp":false,"institutionId":%b}'
+_LOGIN_TEMPLATE = (
+    b'{"emailOrUsername":%b,"password":%b,"hash":%b,"mobileApp":false,"institutionId":%b}'
+)
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
 
 class SchulmanagerAPIError(Exception):
     """Exception raised for API errors."""
@@ -28,14 +38,24 @@ class SchulmanagerAPI:
         self.email = email
         self.password = password
         self.session = session
+        # JSON-encoded once for the salt/login request templates
+        self._email_json = json_bytes(email)
+        self._password_json = json_bytes(password)
+        # PBKDF2 input, encoded once instead of on every (re)login
+        self._password_bytes = password.encode('utf-8')
         self.token: Optional[str] = None
         self.token_expires: Optional[datetime] = None
         self.user_data: Dict[str, Any] = {}
+        # Students from the login response and an id index into them (rebuilt on every login)
+        self._students: List[Dict[str, Any]] = []
+        self._students_by_id: Dict[int, Dict[str, Any]] = {}
         self.bundle_version: Optional[str] = None
         self.bundle_version_expires: Optional[datetime] = None
         # Multi-school support
         self.institution_id: Optional[int] = None
         self.multiple_accounts: Optional[List[Dict[str, Any]]] = None
+        # (salt, hash) of the last login; the salt rarely changes between logins
+        self._salted_hash: Optional[Tuple[str, str]] = None
 
     async def authenticate(self, *, institution_id: Optional[int] = None) -> None:
         """Authenticate with the API. Pass institution_id to select a school when required."""
@@ -43,8 +63,15 @@ class SchulmanagerAPI:
             # Get salt (pass institution_id for multi-school accounts)
             salt = await self._get_salt(institution_id=institution_id)
             
-            # Generate salted hash
-            salted_hash = self._generate_salted_hash(self.password, salt)
+            # Generate salted hash (PBKDF2 is expensive, skip it if the salt is unchanged)
+            if self._salted_hash and self._salted_hash[0] == salt:
+                salted_hash = self._salted_hash[1]
+            else:
+                # ~1 s of CPU; run it in the executor so the event loop stays responsive
+                salted_hash = await asyncio.get_running_loop().run_in_executor(
+                    None, self._generate_salted_hash, salt
+                )
+                self._salted_hash = (salt, salted_hash)
             
             # Login
             await self._login(salted_hash, institution_id=institution_id)
@@ -55,16 +82,12 @@ class SchulmanagerAPI:
 
     async def _get_salt(self, *, institution_id: Optional[int] = None) -> str:
         """Get salt for password hashing. Pass institution_id for multi-school accounts."""
-        payload = {
-            "emailOrUsername": self.email,
-            "mobileApp": False,
-            "institutionId": institution_id
-        }
+        payload = _SALT_TEMPLATE % (self._email_json, json_bytes(institution_id))
         
         _LOGGER.debug("🧂 Requesting salt from: %s", SALT_URL)
         _LOGGER.debug("🧂 Salt request payload: %s", payload)
         
-        async with self.session.post(SALT_URL, json=payload) as response:
+        async with self.session.post(SALT_URL, data=payload, headers=_JSON_HEADERS) as response:
             _LOGGER.debug("🧂 Salt response status: %d", response.status)
             
             if response.status != 200:
@@ -72,19 +95,27 @@ class SchulmanagerAPI:
                 _LOGGER.error("❌ Salt request failed: %d - %s", response.status, error_text)
                 raise SchulmanagerAPIError(f"Failed to get salt: {response.status}")
             
-            try:
-                data = await response.json()
-                _LOGGER.debug("🧂 Salt response JSON: %s", data)
+            # Pick the parser from the content type instead of trying JSON first
+            content_type = response.content_type
+            data = None
+            if content_type.startswith("application/json") or content_type.endswith("+json"):
+                try:
+                    data = json_loads(await response.read())
+                except ValueError as e:
+                    _LOGGER.debug("🧂 Salt response not JSON, trying as text: %s", e)
+                else:
+                    _LOGGER.debug("🧂 Salt response JSON: %s", data)
+            
+            if data is not None:
                 # Handle both string response and object response
                 if isinstance(data, str):
                     salt = data
                 else:
                     salt = data.get("salt")
-            except Exception as e:
-                _LOGGER.debug("🧂 Salt response not JSON, trying as text: %s", e)
-                # If JSON parsing fails, try text
+            else:
                 salt = await response.text()
-                _LOGGER.debug("🧂 Salt response text: %s", salt[:50] + "..." if len(salt) > 50 else salt)
+                _LOGGER.debug("🧂 Salt response text (%s): %s", content_type,
+                              salt[:50] + "..." if len(salt) > 50 else salt)
             
             if not salt:
                 _LOGGER.error("❌ No salt received in response")
@@ -93,7 +124,7 @@ class SchulmanagerAPI:
             _LOGGER.debug("✅ Salt received: %s characters", len(salt))
             return salt
 
-    def _generate_salted_hash(self, password: str, salt: str) -> str:
+    def _generate_salted_hash(self, salt: str) -> str:
         """
         Generate salted hash using PBKDF2-SHA512
         Basierend auf der JavaScript-Implementierung:
@@ -103,14 +134,16 @@ class SchulmanagerAPI:
         - 99999 Iterationen
         """
         try:
-            # Password als bytes (binary)
-            password_bytes = password.encode('utf-8')
-            
             # Salt als UTF-8 encodiert (WICHTIG: nicht hex!)
             salt_bytes = salt.encode('utf-8')
             
             # PBKDF2 mit SHA-512, 512 Bytes Output, 99999 Iterationen
-            hash_bytes = hashlib.pbkdf2_hmac('sha512', password_bytes, salt_bytes, 99999, dklen=512)
+            # (cryptography measured ~1.3-1.5x faster than hashlib.pbkdf2_hmac in
+            # test-scripts/pbkdf2_benchmark.py on CPython 3.11, cryptography's bundled
+            # OpenSSL vs. system OpenSSL 3.0; re-run it for other setups)
+            kdf = PBKDF2HMAC(algorithm=hashes.SHA512(), length=512, salt=salt_bytes, iterations=99999)
+            # (Password als bytes wurde im Konstruktor vorberechnet)
+            hash_bytes = kdf.derive(self._password_bytes)
             
             # Convert to hex (1024 characters)
             hash_hex = hash_bytes.hex()
@@ -122,15 +155,14 @@ class SchulmanagerAPI:
 
     async def _login(self, salted_hash: str, *, institution_id: Optional[int] = None) -> None:
         """Login with salted hash."""
-        payload = {
-            "emailOrUsername": self.email,
-            "password": self.password,
-            "hash": salted_hash,
-            "mobileApp": False,
-            "institutionId": institution_id,
-        }
-        
-        async with self.session.post(LOGIN_URL, json=payload) as response:
+        payload = _LOGIN_TEMPLATE % (
+            self._email_json,
+            self._password_json,
+            json_bytes(salted_hash),
+            json_bytes(institution_id),
+        )
+        
+        async with self.session.post(LOGIN_URL, data=payload, headers=_JSON_HEADERS) as response:
             if response.status != 200:
                 raise SchulmanagerAPIError(f"Login failed: {response.status}")
             
@@ -142,6 +174,8 @@ class SchulmanagerAPI:
                     self.multiple_accounts = accounts  # [{ id, label }, ...]
                     self.token = None
                     self.user_data = {}
+                    self._students = []
+                    self._students_by_id = {}
                     _LOGGER.info("Multi-school account detected with %d schools", len(accounts))
                     return
             
@@ -152,6 +186,12 @@ class SchulmanagerAPI:
             
             # Store user data for later use
             self.user_data = data.get("user", {})
+            self._students = self._collect_students(self.user_data)
+            # First record wins for a repeated id; records without an id stay listed but are not indexed
+            self._students_by_id = {}
+            for student in self._students:
+                if student.get("id") is not None:
+                    self._students_by_id.setdefault(student["id"], student)
             
             # Set token expiration (1 hour from now)
             self.token_expires = datetime.now() + timedelta(hours=1)
@@ -167,6 +207,24 @@ class SchulmanagerAPI:
             
             _LOGGER.debug("Login successful, token expires at %s", self.token_expires)
 
+    @staticmethod
+    def _collect_students(user_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Extract students (children) from the login user data."""
+        students: List[Dict[str, Any]] = []
+        
+        # Check for associated parents (parent account)
+        for parent in user_data.get("associatedParents", []):
+            student = parent.get("student")
+            if student:
+                students.append(student)
+        
+        # Check for associated student (student account)
+        associated_student = user_data.get("associatedStudent")
+        if associated_student:
+            students.append(associated_student)
+        
+        return students
+
     def get_multiple_accounts(self) -> Optional[List[Dict[str, Any]]]:
         """Return multipleAccounts list if the account has multiple schools."""
         return self.multiple_accounts
@@ -382,18 +440,20 @@ class SchulmanagerAPI:
         # Get current bundleVersion (detect dynamically if needed)
         bundle_version = await self._ensure_bundle_version()
         
-        headers = {"Authorization": f"Bearer {self.token}"}
+        headers = {**_JSON_HEADERS, "Authorization": f"Bearer {self.token}"}
         payload = {
             "bundleVersion": bundle_version,  # Dynamically detected bundleVersion
             "requests": requests
         }
+        # Serialize once with orjson; the retry after a 401 reuses the same bytes
+        body = json_bytes(payload)
         
         # Enhanced debug logging
         _LOGGER.debug("🌐 Making API call to: %s", CALLS_URL)
         _LOGGER.debug("📤 Request payload: %s", payload)
         _LOGGER.debug("📋 Request headers: %s", {k: v[:20] + "..." if k == "Authorization" else v for k, v in headers.items()})
         
-        async with self.session.post(CALLS_URL, json=payload, headers=headers) as response:
+        async with self.session.post(CALLS_URL, data=body, headers=headers) as response:
             _LOGGER.debug("📥 Response status: %d", response.status)
             _LOGGER.debug("📋 Response headers: %s", dict(response.headers))
             
@@ -405,10 +465,10 @@ class SchulmanagerAPI:
                 # Token might be invalid, try to re-authenticate once
                 _LOGGER.debug("🔄 Got 401, trying to re-authenticate...")
                 await self.authenticate()
-                headers = {"Authorization": f"Bearer {self.token}"}
+                headers = {**_JSON_HEADERS, "Authorization": f"Bearer {self.token}"}
                 
                 _LOGGER.debug("🔄 Retrying API call with new token...")
-                async with self.session.post(CALLS_URL, json=payload, headers=headers) as retry_response:
+                async with self.session.post(CALLS_URL, data=body, headers=headers) as retry_response:
                     retry_text = await retry_response.text()
                     _LOGGER.debug("🔄 Retry response status: %d", retry_response.status)
                     _LOGGER.debug("🔄 Retry response body: %s", retry_text[:500])
@@ -418,7 +478,7 @@ class SchulmanagerAPI:
                         raise SchulmanagerAPIError(f"API call failed after retry: {retry_response.status}")
                     
                     try:
-                        return await retry_response.json()
+                        return json_loads(retry_text)
                     except Exception as e:
                         _LOGGER.error("❌ Failed to parse retry response JSON: %s", e)
                         raise SchulmanagerAPIError(f"Invalid JSON in retry response: {e}")
@@ -428,7 +488,7 @@ class SchulmanagerAPI:
                 
                 # Try to parse error response for more details
                 try:
-                    error_data = await response.json()
+                    error_data = json_loads(response_text)
                     _LOGGER.error("❌ Error response JSON: %s", error_data)
                 except:
                     _LOGGER.error("❌ Error response is not JSON: %s", response_text)
@@ -437,7 +497,8 @@ class SchulmanagerAPI:
             
             # Parse successful response
             try:
-                response_data = await response.json()
+                # Parse the body already read above instead of decoding it again
+                response_data = json_loads(response_text)
                 _LOGGER.debug("✅ Successfully parsed response JSON")
                 _LOGGER.debug("📊 Response structure: %s", list(response_data.keys()) if isinstance(response_data, dict) else type(response_data))
                 
@@ -467,20 +528,8 @@ class SchulmanagerAPI:
         await self._ensure_authenticated()
         
         try:
-            # Extract students from user data (from login response)
-            students = []
-            
-            # Check for associated parents (parent account)
-            associated_parents = self.user_data.get("associatedParents", [])
-            for parent in associated_parents:
-                student = parent.get("student")
-                if student:
-                    students.append(student)
-            
-            # Check for associated student (student account)
-            associated_student = self.user_data.get("associatedStudent")
-            if associated_student:
-                students.append(associated_student)
+            # Students were extracted from the user data once at login
+            students = list(self._students)
             
             # If no students found in user data, the account might not have student access
             if not students:
@@ -563,12 +612,8 @@ class SchulmanagerAPI:
         """Get schedule for a student."""
         
         # Get full student object (required for schedule API)
-        students = await self.get_students()
-        student = None
-        for s in students:
-            if s.get("id") == student_id:
-                student = s
-                break
+        await self.get_students()
+        student = self._students_by_id.get(student_id)
         
         if not student:
             raise SchulmanagerAPIError(f"Student with ID {student_id} not found")
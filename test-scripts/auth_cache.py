@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+On-disk cache for Schulmanager Online login results used by the test scripts.
+
+Logging in costs a 99999-iteration PBKDF2 plus two round-trips, so scripts
+that are run back-to-back reuse the JWT of the previous run until it is
+about to expire or the API rejects it. Only the token and the student IDs
+are stored, not the login's user object with the children's personal data.
+Salts are cached per (email, institutionId) as well, which saves the
+get-salt round-trip when a fresh login is needed.
+
+With SCHULMANAGER_FAST_TEST=1 the PBKDF2 login hash is cached too, keyed by
+(email, salt), so re-runs skip the ~1 s derivation. A new salt misses the
+cache; after a password change the stale hash gets a 401 and is dropped.
+
+Cache location: ~/.cache/schulmanager/ (override with SCHULMANAGER_CACHE_DIR)
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+CACHE_DIR = Path(os.environ.get("SCHULMANAGER_CACHE_DIR", Path.home() / ".cache" / "schulmanager"))
+TOKEN_CACHE_FILE = CACHE_DIR / "jwt.json"
+
+SALT_CACHE_FILE = CACHE_DIR / "salt.json"
+HASH_CACHE_FILE = CACHE_DIR / "hash.json"
+
+# Dev-only: reuse PBKDF2 results between runs (see load_hash)
+FAST_TEST = os.environ.get("SCHULMANAGER_FAST_TEST", "") not in ("", "0")
+
+# The API issues tokens valid for 1 hour; stop reusing them 5 minutes early
+TOKEN_TTL = 3300
+# Salts are per account and rarely change; refetch at least daily
+SALT_TTL = 86400
+
+
+def _read_json(path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    """Write the cache file readable by the current user only (it holds tokens)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def load_token(email: str) -> Optional[Dict[str, Any]]:
+    """Return the cached {'jwt', 'exp', 'student_ids'} entry for email if still valid."""
+    entry = _read_json(TOKEN_CACHE_FILE).get(email)
+    if not entry or entry.get("exp", 0) <= time.time() or "student_ids" not in entry:
+        return None
+    return entry
+
+
+def save_token(email: str, token: str, student_ids: List[int], ttl: int = TOKEN_TTL) -> None:
+    """Store a freshly issued token and the IDs of the account's students for email."""
+    cache = _read_json(TOKEN_CACHE_FILE)
+    cache[email] = {"jwt": token, "exp": time.time() + ttl, "student_ids": student_ids}
+    _write_json(TOKEN_CACHE_FILE, cache)
+
+
+def restore(email: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """Return (token, students) from the cache, or None if a fresh login is needed.
+
+    Only IDs are cached, so each student comes back as {'id': ...} without
+    names until the next full login.
+    """
+    entry = load_token(email)
+    if entry is None:
+        return None
+    return entry["jwt"], [{"id": student_id} for student_id in entry["student_ids"]]
+
+
+def remember(email: str, token: str, students: List[Dict[str, Any]]) -> None:
+    """Cache a freshly issued token together with the IDs of the given students."""
+    save_token(email, token, [student.get("id") for student in students])
+
+
+def invalidate_token(email: str) -> None:
+    """Drop a cached token, e.g. after the API answered 401 for it."""
+    cache = _read_json(TOKEN_CACHE_FILE)
+    if cache.pop(email, None) is not None:
+        _write_json(TOKEN_CACHE_FILE, cache)
+
+
+def _salt_key(email: str, institution_id: Optional[int]) -> str:
+    return f"{email}|{'' if institution_id is None else institution_id}"
+
+
+def load_salt(email: str, institution_id: Optional[int] = None) -> Optional[str]:
+    """Return the cached salt for (email, institution_id) if not expired."""
+    entry = _read_json(SALT_CACHE_FILE).get(_salt_key(email, institution_id))
+    if not entry or entry.get("exp", 0) <= time.time():
+        return None
+    return entry.get("salt")
+
+
+def save_salt(email: str, institution_id: Optional[int], salt: str, ttl: int = SALT_TTL) -> None:
+    """Remember the salt returned by get-salt for (email, institution_id)."""
+    cache = _read_json(SALT_CACHE_FILE)
+    cache[_salt_key(email, institution_id)] = {"salt": salt, "exp": time.time() + ttl}
+    _write_json(SALT_CACHE_FILE, cache)
+
+
+def invalidate_salt(email: str, institution_id: Optional[int] = None) -> None:
+    """Drop a cached salt, e.g. after the login it produced was rejected."""
+    cache = _read_json(SALT_CACHE_FILE)
+    if cache.pop(_salt_key(email, institution_id), None) is not None:
+        _write_json(SALT_CACHE_FILE, cache)
+
+
+def _hash_key(email: str, salt: str) -> str:
+    return f"{email}|{salt}"
+
+
+def load_hash(email: str, salt: str) -> Optional[str]:
+    """Return the cached login hash for (email, salt) (only when FAST_TEST is on)."""
+    if not FAST_TEST:
+        return None
+    return _read_json(HASH_CACHE_FILE).get(_hash_key(email, salt))
+
+
+def save_hash(email: str, salt: str, salted_hash: str) -> None:
+    """Cache a freshly derived login hash (only when FAST_TEST is on)."""
+    if not FAST_TEST:
+        return
+    cache = _read_json(HASH_CACHE_FILE)
+    cache[_hash_key(email, salt)] = salted_hash
+    _write_json(HASH_CACHE_FILE, cache)
+
+
+def invalidate_hash(email: str, salt: str) -> None:
+    """Drop a cached login hash that the server rejected (e.g. after a password change)."""
+    cache = _read_json(HASH_CACHE_FILE)
+    if cache.pop(_hash_key(email, salt), None) is not None:
+        _write_json(HASH_CACHE_FILE, cache)
@@ -38,7 +38,6 @@ For detailed instructions, see: documentation/Debug_Script_Guide.md
 from __future__ import annotations
 
 import argparse
-import hashlib
 import json
 import os
 import re
@@ -49,6 +48,8 @@ from typing import Any, Dict, List, Optional
 
 import requests
 
+from login_hash import pbkdf2_hmac
+
 API_BASE_URL = "https://login.schulmanager-online.de/"
 SALT_URL = API_BASE_URL + "api/get-salt"
 LOGIN_URL = API_BASE_URL + "api/login"
@@ -118,7 +119,7 @@ def _dump_json(name: str, data: Any, redact_names: bool = False) -> None:
 def pbkdf2_sha512_hex(password: str, salt: str) -> str:
     pw_bytes = password.encode("utf-8")
     salt_bytes = salt.encode("utf-8")
-    dk = hashlib.pbkdf2_hmac("sha512", pw_bytes, salt_bytes, 99999, dklen=512)
+    dk = pbkdf2_hmac("sha512", pw_bytes, salt_bytes, 99999, 512)
     return dk.hex()
 
 
@@ -383,13 +384,18 @@ def main() -> int:
             
             print()
             print(f"Step 3b/5: Re-fetching salt with Institution ID {selected_inst_id}...")
-            salt = get_salt(args.email, institution_id=selected_inst_id)
-            print(f"         ✓ Institution-specific salt received ({len(salt)} characters)")
+            inst_salt = get_salt(args.email, institution_id=selected_inst_id)
+            print(f"         ✓ Institution-specific salt received ({len(inst_salt)} characters)")
             
             print()
-            print(f"Step 3c/5: Re-computing hash with institution-specific salt...")
-            hash_hex = pbkdf2_sha512_hex(args.password, salt)
-            print(f"         ✓ Institution-specific hash computed ({len(hash_hex)} characters)")
+            if inst_salt == salt:
+                # Salts are usually per user, so the hash from step 2 still applies
+                print(f"Step 3c/5: Salt unchanged, reusing hash from step 2")
+            else:
+                print(f"Step 3c/5: Re-computing hash with institution-specific salt...")
+                salt = inst_salt
+                hash_hex = pbkdf2_sha512_hex(args.password, salt)
+                print(f"         ✓ Institution-specific hash computed ({len(hash_hex)} characters)")
             
             print()
             print(f"Step 3d/5: Re-authenticating with Institution ID {selected_inst_id}...")
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Shared entry point for the async Schulmanager Online test scripts.
+
+run() replaces asyncio.run() in a script's __main__ block and uses the
+libuv-based uvloop event loop when it is installed.
+"""
+
+import asyncio
+import sys
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+def run(main):
+    """Run the coroutine main to completion and return its result."""
+    if uvloop is None:
+        return asyncio.run(main)
+    if sys.version_info >= (3, 11):
+        # uvloop.install() is deprecated from Python 3.12 on
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            return runner.run(main)
+    uvloop.install()
+    return asyncio.run(main)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Shared aiohttp session for the Schulmanager Online test scripts.
+
+Every request in a run goes through one pooled session, so the TLS handshake
+with schulmanager-online.de is paid once and later requests reuse the
+keep-alive connection. Call close_session() once when the script is done.
+"""
+
+from typing import Optional
+
+import aiohttp
+
+try:
+    # c-ares DNS lookups on the event loop instead of getaddrinfo in a thread
+    import aiodns
+except ImportError:
+    aiodns = None
+
+_SESSION: Optional[aiohttp.ClientSession] = None
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Return the shared session, creating it on first use."""
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        connector = aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=20,  # everything goes to login.schulmanager-online.de
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+            resolver=aiohttp.AsyncResolver() if aiodns is not None else None,
+        )
+        _SESSION = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+    return _SESSION
+
+
+async def close_session() -> None:
+    """Close the shared session (must run inside the loop that created it)."""
+    global _SESSION
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    _SESSION = None
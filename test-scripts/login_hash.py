@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+PBKDF2 for the Schulmanager Online login hash, shared by the test scripts.
+
+hashlib.pbkdf2_hmac (OpenSSL PKCS5_PBKDF2_HMAC) already keys the HMAC once
+and reuses that context for every iteration. The optional fastpbkdf2
+package is used when installed, with the same signature and output.
+It has not been measured against hashlib yet, so run pbkdf2_benchmark.py
+before assuming it is faster on your machine.
+"""
+
+try:
+    from fastpbkdf2 import pbkdf2_hmac
+except ImportError:
+    from hashlib import pbkdf2_hmac
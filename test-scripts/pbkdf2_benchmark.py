@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Benchmark PBKDF2-HMAC-SHA512 implementations for the Schulmanager login hash.
+
+The login hash is PBKDF2-SHA512 with 99999 iterations and a 512-byte output,
+hex encoded (see SchulmanagerAPI._generate_salted_hash). Every candidate is
+checked against hashlib.pbkdf2_hmac before its timing is reported, so only
+drop-in replacements show up as ✅.
+
+Optional candidates are skipped when their package is not installed.
+
+Usage:
+    python3 pbkdf2_benchmark.py
+    python3 pbkdf2_benchmark.py --iterations 10000 --rounds 5
+"""
+
+import argparse
+import base64
+import binascii
+import ctypes
+import ctypes.util
+import hashlib
+import hmac
+import os
+import ssl
+import time
+import timeit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import repeat
+
+ITERATIONS = 99999
+DKLEN = 512
+SHA512_SIZE = 64
+
+# Same shape as a real login: short UTF-8 password, 32-character salt string
+PASSWORD = "benchmark-Passw0rd!".encode("utf-8")
+SALT = "Xk9vQ2mR7tLp4wZs8nBc1fHj6yDg3eAu".encode("utf-8")
+
+
+def pbkdf2_hashlib(password: bytes, salt: bytes, iterations: int, dklen: int) -> bytes:
+    """Reference implementation used by the integration (OpenSSL via hashlib)."""
+    return hashlib.pbkdf2_hmac("sha512", password, salt, iterations, dklen=dklen)
+
+
+CANDIDATES = {
+    "hashlib": pbkdf2_hashlib,
+}
+
+try:
+    import fastpbkdf2
+except ImportError:
+    fastpbkdf2 = None
+else:
+    def pbkdf2_fastpbkdf2(password: bytes, salt: bytes, iterations: int, dklen: int) -> bytes:
+        """fastpbkdf2 C extension (HMAC ipad/opad state computed once per block)."""
+        return fastpbkdf2.pbkdf2_hmac("sha512", password, salt, iterations, dklen)
+
+    CANDIDATES["fastpbkdf2"] = pbkdf2_fastpbkdf2
+
+try:
+    from cryptography.hazmat.backends.openssl.backend import backend as cryptography_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+except ImportError:
+    cryptography_backend = None
+else:
+    def pbkdf2_cryptography(password: bytes, salt: bytes, iterations: int, dklen: int) -> bytes:
+        """cryptography's PBKDF2HMAC (OpenSSL PKCS5_PBKDF2_HMAC through its own libcrypto)."""
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA512(), length=dklen, salt=salt, iterations=iterations)
+        return kdf.derive(password)
+
+    CANDIDATES["cryptography"] = pbkdf2_cryptography
+
+_libcrypto_path = ctypes.util.find_library("crypto")
+if _libcrypto_path:
+    libcrypto = ctypes.CDLL(_libcrypto_path)
+    libcrypto.EVP_sha512.restype = ctypes.c_void_p
+    libcrypto.PKCS5_PBKDF2_HMAC.argtypes = [
+        ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int,
+        ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_char_p,
+    ]
+
+    def pbkdf2_libcrypto(password: bytes, salt: bytes, iterations: int, dklen: int) -> bytes:
+        """PKCS5_PBKDF2_HMAC called through ctypes on the system libcrypto."""
+        out = ctypes.create_string_buffer(dklen)
+        ok = libcrypto.PKCS5_PBKDF2_HMAC(
+            password, len(password), salt, len(salt), iterations, libcrypto.EVP_sha512(), dklen, out
+        )
+        if ok != 1:
+            raise RuntimeError("PKCS5_PBKDF2_HMAC failed")
+        return out.raw
+
+    CANDIDATES[f"ctypes {os.path.basename(_libcrypto_path)}"] = pbkdf2_libcrypto
+
+
+def _pbkdf2_block(password: bytes, salt: bytes, iterations: int, index: int,
+                  hash_alg: str = "sha512") -> bytes:
+    """Compute output block T_index = U_1 ^ ... ^ U_c independently of the others.
+
+    The keyed HMAC object is built once and copied per iteration, so the
+    ipad/opad key schedule is not redone for every U_j.
+    """
+    base = hmac.new(password, digestmod=hash_alg)
+    mac = base.copy()
+    mac.update(salt + index.to_bytes(4, "big"))
+    u = mac.digest()
+    acc = int.from_bytes(u, "big")
+    for _ in range(iterations - 1):
+        mac = base.copy()
+        mac.update(u)
+        u = mac.digest()
+        acc ^= int.from_bytes(u, "big")
+    return acc.to_bytes(base.digest_size, "big")
+
+
+def pbkdf2_manual(password: bytes, salt: bytes, iterations: int, dklen: int,
+                  hash_alg: str = "sha512") -> bytes:
+    """Serial PBKDF2 over _pbkdf2_block for any hash hmac accepts (e.g. blake2b)."""
+    size = hashlib.new(hash_alg).digest_size
+    blocks = -(-dklen // size)
+    return b"".join(_pbkdf2_block(password, salt, iterations, i, hash_alg) for i in range(1, blocks + 1))[:dklen]
+
+
+def pbkdf2_parallel(password: bytes, salt: bytes, iterations: int, dklen: int,
+                    executor=ProcessPoolExecutor) -> bytes:
+    """Derive the dklen/64 output blocks (8 for the login hash) in parallel workers.
+
+    Processes by default: hashlib only releases the GIL for updates of 2 KiB
+    or more, so 64-byte HMAC chains in threads run serially (the threads
+    candidate is kept to show that).
+    """
+    blocks = -(-dklen // SHA512_SIZE)
+    workers = blocks if executor is ThreadPoolExecutor else min(blocks, os.cpu_count() or 1)
+    with executor(max_workers=workers) as pool:
+        parts = pool.map(_pbkdf2_block, repeat(password), repeat(salt), repeat(iterations), range(1, blocks + 1))
+        return b"".join(parts)[:dklen]
+
+
+CANDIDATES["parallel blocks"] = pbkdf2_parallel
+CANDIDATES["parallel blocks (threads)"] = partial(pbkdf2_parallel, executor=ThreadPoolExecutor)
+
+
+def pbkdf2_hmac_digest(password: bytes, salt: bytes, iterations: int, dklen: int) -> bytes:
+    """Hand-rolled PBKDF2 on the one-shot hmac.digest() (Python 3.7+) fast path."""
+    blocks = []
+    for index in range(1, -(-dklen // SHA512_SIZE) + 1):
+        u = hmac.digest(password, salt + index.to_bytes(4, "big"), "sha512")
+        acc = int.from_bytes(u, "big")
+        for _ in range(iterations - 1):
+            u = hmac.digest(password, u, "sha512")
+            acc ^= int.from_bytes(u, "big")
+        blocks.append(acc.to_bytes(SHA512_SIZE, "big"))
+    return b"".join(blocks)[:dklen]
+
+
+CANDIDATES["hmac.digest"] = pbkdf2_hmac_digest
+
+
+def pbkdf2_sha512_copy(password: bytes, salt: bytes, iterations: int, dklen: int) -> bytes:
+    """HMAC spelled out on raw sha512 objects: ipad/opad absorbed once, copied per U_j.
+
+    Each U_j then costs two compressions (2 + 2n per block) without the
+    hmac module's wrapper objects around the copies.
+    """
+    block_size = hashlib.sha512().block_size
+    key = hashlib.sha512(password).digest() if len(password) > block_size else password
+    key = key.ljust(block_size, b"\0")
+    inner = hashlib.sha512(bytes(b ^ 0x36 for b in key))
+    outer = hashlib.sha512(bytes(b ^ 0x5C for b in key))
+
+    blocks = []
+    for index in range(1, -(-dklen // SHA512_SIZE) + 1):
+        mac = inner.copy()
+        mac.update(salt + index.to_bytes(4, "big"))
+        final = outer.copy()
+        final.update(mac.digest())
+        u = final.digest()
+        acc = int.from_bytes(u, "big")
+        for _ in range(iterations - 1):
+            mac = inner.copy()
+            mac.update(u)
+            final = outer.copy()
+            final.update(mac.digest())
+            u = final.digest()
+            acc ^= int.from_bytes(u, "big")
+        blocks.append(acc.to_bytes(SHA512_SIZE, "big"))
+    return b"".join(blocks)[:dklen]
+
+
+CANDIDATES["sha512 ipad/opad .copy()"] = pbkdf2_sha512_copy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+else:
+    def pbkdf2_hmac_digest_numpy(password: bytes, salt: bytes, iterations: int, dklen: int) -> bytes:
+        """hmac.digest chain with the XOR accumulator kept as 8 uint64 lanes.
+
+        XOR is bytewise, so the lanes need no byteswap on little-endian hosts.
+        """
+        blocks = []
+        for index in range(1, -(-dklen // SHA512_SIZE) + 1):
+            u = hmac.digest(password, salt + index.to_bytes(4, "big"), "sha512")
+            acc = np.frombuffer(u, dtype=np.uint64).copy()
+            for _ in range(iterations - 1):
+                u = hmac.digest(password, u, "sha512")
+                acc ^= np.frombuffer(u, dtype=np.uint64)
+            blocks.append(acc.tobytes())
+        return b"".join(blocks)[:dklen]
+
+    CANDIDATES["hmac.digest + numpy"] = pbkdf2_hmac_digest_numpy
+
+
+def print_crypto_backends() -> None:
+    """Show which libcrypto each candidate runs on and whether CPU features are masked."""
+    print(f"   hashlib:      {ssl.OPENSSL_VERSION}")
+    if cryptography_backend is not None:
+        print(f"   cryptography: {cryptography_backend.openssl_version_text()}")
+    ia32cap = os.environ.get("OPENSSL_ia32cap")
+    if ia32cap:
+        # Masked capability bits force OpenSSL onto its generic (slower) SHA-512 code
+        print(f"   ⚠️ OPENSSL_ia32cap={ia32cap} overrides CPU feature detection")
+
+
+def benchmark(func, iterations: int, rounds: int):
+    """Return (best wall time in seconds, last result) over the given rounds."""
+    best = float("inf")
+    result = b""
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(PASSWORD, SALT, iterations, DKLEN)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+HEX_ENCODERS = {
+    "bytes.hex()": lambda b: b.hex(),
+    "binascii.hexlify": lambda b: binascii.hexlify(b).decode("ascii"),
+    # Not accepted by the server (it expects 1024 hex characters); for comparison only
+    "base64 (reference)": lambda b: base64.b64encode(b).decode("ascii"),
+}
+
+
+# Same manual loop with other hash functions. Timing only: the server checks
+# a PBKDF2-SHA512 hash with a 512-byte output, so neither the hash nor dklen
+# can change on the client.
+HASH_ALGS = ("sha512", "sha256", "blake2b")
+
+
+def print_hash_algs(iterations: int, rounds: int) -> None:
+    """Compare per-iteration cost of the manual PBKDF2 loop across hash functions."""
+    print()
+    print(f"   Manual PBKDF2 by hash function, dklen {DKLEN} (timing only, the server requires sha512):")
+    baseline = None
+    for hash_alg in HASH_ALGS:
+        elapsed, _ = benchmark(partial(pbkdf2_manual, hash_alg=hash_alg), iterations, rounds)
+        if baseline is None:
+            baseline = elapsed
+        print(f"   {hash_alg:<28} {elapsed * 1000:9.1f} ms  {baseline / elapsed:5.2f}x")
+
+
+def print_hex_encodings(derived: bytes, number: int = 100000) -> None:
+    """Time encoding the 512-byte derived key into the string sent as 'hash'."""
+    print()
+    print(f"   Encoding the {len(derived)}-byte key:")
+    for name, encode in HEX_ENCODERS.items():
+        elapsed = min(timeit.repeat(lambda: encode(derived), number=number, repeat=5)) / number
+        print(f"   {name:<28} {elapsed * 1e6:9.2f} µs  ({len(encode(derived))} chars)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark PBKDF2-SHA512 implementations")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS,
+                        help=f"PBKDF2 iterations (default: {ITERATIONS}, as used by the server)")
+    parser.add_argument("--rounds", type=int, default=3, help="Timed rounds per candidate (best is reported)")
+    args = parser.parse_args()
+
+    print("🔐 PBKDF2-HMAC-SHA512 benchmark")
+    print("=" * 60)
+    print(f"   Iterations: {args.iterations}, dklen: {DKLEN}, rounds: {args.rounds}, CPUs: {os.cpu_count()}")
+    print_crypto_backends()
+    print()
+
+    reference = pbkdf2_hashlib(PASSWORD, SALT, args.iterations, DKLEN)
+    baseline = None
+    for name, func in CANDIDATES.items():
+        elapsed, result = benchmark(func, args.iterations, args.rounds)
+        if baseline is None:
+            baseline = elapsed
+        status = "✅" if result == reference else "❌ output differs from hashlib"
+        print(f"   {name:<28} {elapsed * 1000:9.1f} ms  {baseline / elapsed:5.2f}x  {status}")
+
+    print_hash_algs(args.iterations, args.rounds)
+    print_hex_encodings(reference)
+
+
+if __name__ == "__main__":
+    main()
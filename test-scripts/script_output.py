@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+Shared output switch for the Schulmanager Online test scripts.
+
+Set SCHULMANAGER_VERBOSE=0 (or false/no/off, or leave it empty) to skip the
+detailed per-field and per-item output, and the json.dumps calls behind it.
+Step headers, statuses and errors are always printed.
+"""
+
+import os
+
+VERBOSE = os.environ.get("SCHULMANAGER_VERBOSE", "1").strip().lower() not in ("0", "false", "no", "off", "")
+
+# print, or a no-op when verbose output is switched off
+log = print if VERBOSE else (lambda *args, **kwargs: None)
@@ -36,6 +36,8 @@ class StandaloneSchulmanagerAPI:
         """Initialize the API client."""
         self.email = email
         self.password = password
+        # PBKDF2 input, encoded once instead of on every login
+        self._password_bytes = password.encode('utf-8')
         self.session = session
         self.token: Optional[str] = None
         self.token_expires: Optional[datetime] = None
@@ -49,7 +51,7 @@ class StandaloneSchulmanagerAPI:
             salt = await self._get_salt()
             
             # Generate salted hash
-            salted_hash = self._generate_salted_hash(self.password, salt)
+            salted_hash = self._generate_salted_hash(salt)
             
             # Login
             await self._login(salted_hash)
@@ -86,17 +88,15 @@ class StandaloneSchulmanagerAPI:
             
             return salt
 
-    def _generate_salted_hash(self, password: str, salt: str) -> str:
+    def _generate_salted_hash(self, salt: str) -> str:
         """Generate salted hash using PBKDF2-SHA512."""
         try:
-            # Password as bytes
-            password_bytes = password.encode('utf-8')
-            
             # Salt as UTF-8 encoded (IMPORTANT: not hex!)
             salt_bytes = salt.encode('utf-8')
             
             # PBKDF2 with SHA-512, 512 bytes output, 99999 iterations
-            hash_bytes = hashlib.pbkdf2_hmac('sha512', password_bytes, salt_bytes, 99999, dklen=512)
+            # (password bytes are precomputed in __init__)
+            hash_bytes = hashlib.pbkdf2_hmac('sha512', self._password_bytes, salt_bytes, 99999, dklen=512)
             
             # Convert to hex (1024 characters)
             hash_hex = hash_bytes.hex()
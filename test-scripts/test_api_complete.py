@@ -133,7 +133,7 @@ async def comprehensive_api_test():
             
             # Schritt 2: Hash generieren
             print("🔐 Passwort-Hash generieren...")
-            salted_hash = api._generate_salted_hash(password, salt)
+            salted_hash = api._generate_salted_hash(salt)
             print(f"✅ Hash generiert: {salted_hash[:30]}...")
             
             # Schritt 3: Login
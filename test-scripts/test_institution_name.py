@@ -1,12 +1,65 @@
 #!/usr/bin/env python3
 """Test script to find institution name in API response."""
 
-import asyncio
 import aiohttp
 import json
 import hashlib
 import base64
 
+from event_loop import run
+from script_output import VERBOSE, log
+
+try:
+    import ijson
+except ImportError:  # optional, falls back to response.json()
+    ijson = None
+
+# Institution-related keys observed in the login response (user and student objects)
+_INST_KEYS = frozenset({
+    'institution', 'institutionId', 'institutionName',
+    'school', 'schoolId', 'schoolName',
+})
+
+# Personal fields left out of the sanitized user dump
+_SANITIZED_KEYS = frozenset({'id', 'firstname', 'lastname', 'email'})
+
+
+def _walk_user_data(user_data):
+    """Collect institution fields, nested objects and the sanitized dump in one pass."""
+    institution_fields = {}
+    nested_objects = {}
+    sanitized = {}
+    for key, value in user_data.items():
+        if key in _INST_KEYS:
+            institution_fields[key] = value
+        if isinstance(value, dict):
+            nested_objects[key] = value
+        if key not in _SANITIZED_KEYS:
+            sanitized[key] = value
+    return institution_fields, nested_objects, sanitized
+
+
+async def _read_user_institution_fields(response):
+    """Return (user keys, institution fields) from a login response.
+
+    With ijson installed the body is stream-parsed and only the
+    user.<institution key> values are built; everything else is skipped.
+    """
+    if ijson is None:
+        user_data = (await response.json()).get("user", {})
+        return list(user_data.keys()), {key: user_data[key] for key in _INST_KEYS & user_data.keys()}
+
+    user_keys = []
+    builders = {}
+    async for prefix, event, value in ijson.parse_async(response.content):
+        if prefix == 'user' and event == 'map_key':
+            user_keys.append(value)
+        elif prefix.startswith('user.'):
+            key = prefix[5:].split('.', 1)[0]
+            if key in _INST_KEYS:
+                builders.setdefault(key, ijson.ObjectBuilder()).event(event, value)
+    return user_keys, {key: builder.value for key, builder in builders.items()}
+
 async def test_institution_name():
     """Check where institution name comes from in API response."""
     
@@ -71,63 +124,57 @@ async def test_institution_name():
                 
                 data = await response.json()
                 print(f"   ✅ Login successful!")
-                print(f"\n📋 Top-level response keys: {list(data.keys())}")
+                log(f"\n📋 Top-level response keys: {list(data.keys())}")
                 
                 # Check user data
                 user_data = data.get("user", {})
-                print(f"\n👤 User data keys: {list(user_data.keys())}")
+                log(f"\n👤 User data keys: {list(user_data.keys())}")
                 
                 # Check for institution-related fields
                 print(f"\n🏫 Looking for institution information...")
                 
-                # Check direct fields
-                institution_fields = {}
-                for key in user_data.keys():
-                    if 'institution' in key.lower() or 'school' in key.lower():
-                        institution_fields[key] = user_data[key]
+                institution_fields, nested_objects, sanitized = _walk_user_data(user_data)
                 
                 if institution_fields:
-                    print(f"\n   ✅ Institution-related fields found:")
+                    log(f"\n   ✅ Institution-related fields found:")
                     for key, value in institution_fields.items():
                         if isinstance(value, dict):
-                            print(f"      {key}: {json.dumps(value, indent=8)}")
+                            if VERBOSE:
+                                print(f"      {key}: {json.dumps(value, indent=8)}")
                         else:
-                            print(f"      {key}: {value}")
+                            log(f"      {key}: {value}")
                 else:
                     print(f"   ⚠️ No direct institution fields found")
                 
                 # Check nested objects
-                print(f"\n🔍 Checking nested objects...")
-                for key, value in user_data.items():
-                    if isinstance(value, dict):
-                        print(f"\n   Object: user.{key}")
-                        print(f"   Keys: {list(value.keys())}")
-                        # Look for name-related fields
-                        for nested_key in value.keys():
-                            if 'name' in nested_key.lower():
-                                print(f"      ✅ {nested_key}: {value[nested_key]}")
+                log(f"\n🔍 Checking nested objects...")
+                for key, value in nested_objects.items():
+                    log(f"\n   Object: user.{key}")
+                    log(f"   Keys: {list(value.keys())}")
+                    # Look for name-related fields
+                    for nested_key in value.keys():
+                        if 'name' in nested_key.lower():
+                            log(f"      ✅ {nested_key}: {value[nested_key]}")
                 
                 # Check associated parents for institution info
                 if "associatedParents" in user_data:
-                    print(f"\n👨‍👩‍👧 Checking associatedParents...")
+                    log(f"\n👨‍👩‍👧 Checking associatedParents...")
                     for i, parent in enumerate(user_data["associatedParents"]):
-                        print(f"\n   Parent {i}:")
-                        print(f"     Keys: {list(parent.keys())}")
+                        log(f"\n   Parent {i}:")
+                        log(f"     Keys: {list(parent.keys())}")
                         
                         if "student" in parent:
                             student = parent["student"]
-                            print(f"     Student keys: {list(student.keys())}")
+                            log(f"     Student keys: {list(student.keys())}")
                             
                             # Check for institution info in student
-                            for key in student.keys():
-                                if 'institution' in key.lower() or 'school' in key.lower():
-                                    print(f"       ✅ {key}: {student[key]}")
+                            for key in _INST_KEYS & student.keys():
+                                log(f"       ✅ {key}: {student[key]}")
                 
                 # Print full user data (sanitized)
-                print(f"\n📄 Full user data structure (sanitized):")
-                sanitized = {k: v for k, v in user_data.items() 
-                            if k not in ['id', 'firstname', 'lastname', 'email']}
-                print(json.dumps(sanitized, indent=2, default=str))
+                log(f"\n📄 Full user data structure (sanitized):")
+                if VERBOSE:
+                    print(json.dumps(sanitized, indent=2, default=str))
                 
                 # Now test with specific institutionId
                 print(f"\n\n" + "=" * 60)
@@ -145,10 +192,14 @@ async def test_institution_name():
                     salt2 = await response.text()
                     salt2 = salt2.strip('"')
                 
-                # Generate new hash
-                salt_bytes2 = base64.b64decode(salt2)
-                derived2 = hashlib.pbkdf2_hmac('sha512', password_bytes, salt_bytes2, iterations, key_length)
-                salted_hash2 = base64.b64encode(derived2).decode('utf-8')
+                # Generate new hash (salts are per user, so this one usually matches step 1)
+                if salt2 == salt:
+                    salted_hash2 = salted_hash
+                    print(f"   ♻️ Same salt as unscoped login, reusing hash")
+                else:
+                    salt_bytes2 = base64.b64decode(salt2)
+                    derived2 = hashlib.pbkdf2_hmac('sha512', password_bytes, salt_bytes2, iterations, key_length)
+                    salted_hash2 = base64.b64encode(derived2).decode('utf-8')
                 
                 # Login with institutionId
                 async with session.post(
@@ -161,22 +212,20 @@ async def test_institution_name():
                         "institutionId": 13309
                     }
                 ) as response:
-                    data2 = await response.json()
+                    user_keys2, institution_fields2 = await _read_user_institution_fields(response)
                     print(f"   ✅ Login with institutionId=13309 successful!")
                     
-                    user_data2 = data2.get("user", {})
-                    print(f"\n👤 User data keys: {list(user_data2.keys())}")
+                    log(f"\n👤 User data keys: {user_keys2}")
                     
                     # Check for institution info
-                    print(f"\n🏫 Institution information:")
-                    for key in user_data2.keys():
-                        if 'institution' in key.lower():
-                            value = user_data2[key]
-                            if isinstance(value, dict):
-                                print(f"   {key}:")
+                    log(f"\n🏫 Institution information:")
+                    for key, value in institution_fields2.items():
+                        if isinstance(value, dict):
+                            log(f"   {key}:")
+                            if VERBOSE:
                                 print(json.dumps(value, indent=4))
-                            else:
-                                print(f"   {key}: {value}")
+                        else:
+                            log(f"   {key}: {value}")
             
         except Exception as e:
             print(f"❌ Error: {e}")
@@ -190,7 +239,7 @@ if __name__ == "__main__":
     print("🧪 Schulmanager Institution Name Investigation")
     print("=" * 70)
     
-    success = asyncio.run(test_institution_name())
+    success = run(test_institution_name())
     
     if success:
         print("\n🎉 Investigation completed!")
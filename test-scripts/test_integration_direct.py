@@ -4,14 +4,18 @@ Direct test of the Schulmanager Online Integration without Home Assistant
 This simulates what Home Assistant would do with our integration
 """
 
-import asyncio
+import mmap
 import sys
 import os
 import json
 from datetime import datetime, timedelta
 
-# Add the custom_components path to sys.path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'schulmanager_online'))
+from event_loop import run
+from script_output import log
+
+# Make the repository root importable so the integration loads as a package
+# (api.py uses package-relative imports)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 # Mock Home Assistant modules
 class MockConfigEntry:
@@ -30,8 +34,8 @@ class MockConfig:
 
 # Import our integration modules
 try:
-    from const import DOMAIN, CONF_EMAIL, CONF_PASSWORD
-    from api import SchulmanagerOnlineAPI
+    from custom_components.schulmanager_online.const import DOMAIN, CONF_EMAIL, CONF_PASSWORD
+    from custom_components.schulmanager_online.api import SchulmanagerAPI
     import aiohttp
     
     print("✅ Integration modules imported successfully!")
@@ -61,7 +65,7 @@ async def test_integration_components():
     print("1️⃣ Testing API Client...")
     try:
         session = aiohttp.ClientSession()
-        api = SchulmanagerOnlineAPI(email, password, session)
+        api = SchulmanagerAPI(email, password, session)
         
         # Test authentication
         await api.authenticate()
@@ -98,7 +102,7 @@ async def test_integration_components():
     # 3. Test Constants
     print("3️⃣ Testing Constants...")
     try:
-        from const import (
+        from custom_components.schulmanager_online.const import (
             SENSOR_CURRENT_LESSON, SENSOR_NEXT_LESSON, SENSOR_TODAY_LESSONS,
             SENSOR_TODAY_CHANGES, SENSOR_TOMORROW_LESSONS, SENSOR_THIS_WEEK,
             SENSOR_NEXT_WEEK, SENSOR_CHANGES_DETECTED
@@ -112,7 +116,7 @@ async def test_integration_components():
         
         print(f"   ✅ All 8 sensors defined:")
         for i, sensor in enumerate(sensors, 1):
-            print(f"      {i}. {sensor}")
+            log(f"      {i}. {sensor}")
             
     except Exception as e:
         print(f"   ❌ Constants failed: {e}")
@@ -124,12 +128,15 @@ async def test_integration_components():
     print("4️⃣ Testing Translations...")
     try:
         translations_dir = os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'schulmanager_online', 'translations')
-        translation_files = [f for f in os.listdir(translations_dir) if f.endswith('.json')]
+        translation_files = [
+            entry.name for entry in os.scandir(translations_dir)
+            if entry.name.endswith('.json') and entry.is_file(follow_symlinks=False)
+        ]
         
         print(f"   ✅ Found {len(translation_files)} translation files:")
         for file in sorted(translation_files):
             lang = file.replace('.json', '')
-            print(f"      🌍 {lang}")
+            log(f"      🌍 {lang}")
             
     except Exception as e:
         print(f"   ❌ Translations check failed: {e}")
@@ -143,11 +150,6 @@ async def test_integration_components():
         card_path = os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'schulmanager_online', 'www', 'schulmanager-schedule-card.js')
         
         if os.path.exists(card_path):
-            with open(card_path, 'r') as f:
-                card_content = f.read()
-                
-            print(f"   ✅ Custom Card found: {len(card_content)} characters")
-            
             # Check for key features
             features = [
                 'class SchulmanagerScheduleCard',
@@ -157,10 +159,14 @@ async def test_integration_components():
                 'current-next-view'
             ]
             
-            found_features = [f for f in features if f in card_content]
+            # Search the mapped bytes directly instead of decoding the whole card
+            with open(card_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as card_content:
+                print(f"   ✅ Custom Card found: {len(card_content)} bytes")
+                found_features = [feature for feature in features if card_content.find(feature.encode()) != -1]
+            
             print(f"   🎨 Features found: {len(found_features)}/{len(features)}")
             for feature in found_features:
-                print(f"      ✅ {feature}")
+                log(f"      ✅ {feature}")
                 
         else:
             print(f"   ❌ Custom Card not found at {card_path}")
@@ -202,5 +208,5 @@ async def main():
     return success
 
 if __name__ == "__main__":
-    success = asyncio.run(main())
+    success = run(main())
     exit(0 if success else 1)
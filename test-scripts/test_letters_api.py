@@ -1,25 +1,109 @@
 #!/usr/bin/env python3
 """Test script for Schulmanager Online Letters API."""
 
-import asyncio
 import aiohttp
 import json
 import hashlib
+import ssl
+import subprocess
+import warnings
 from datetime import datetime, timedelta
 
+from auth_cache import invalidate_token, remember, restore
+from event_loop import run
+from script_output import VERBOSE, log
+
+_openssl_checked = False
+
+
+def _warn_if_no_asm():
+    """Warn once if hashlib's OpenSSL was built with no-asm (software-only SHA-512).
+
+    PBKDF2 runs ~10x slower on such builds. The openssl CLI is only trusted
+    when it reports the same version Python is linked against.
+    """
+    global _openssl_checked
+    if _openssl_checked:
+        return
+    _openssl_checked = True
+    
+    try:
+        result = subprocess.run(['openssl', 'version', '-a'], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return
+    
+    if not result.stdout.startswith(ssl.OPENSSL_VERSION):
+        return
+    for line in result.stdout.splitlines():
+        if line.startswith('compiler:') and '-DOPENSSL_NO_ASM' in line:
+            warnings.warn(
+                f"{ssl.OPENSSL_VERSION} is built with no-asm; PBKDF2 login hashing will be ~10x slower",
+                RuntimeWarning,
+            )
+
+
+def _poqa_payload(letter_id, student_id) -> dict:
+    """Build the letter details request (poqa findByPk) for one letter and student."""
+    return {
+        "bundleVersion": "3505280ee7",
+        "requests": [
+            {
+                "moduleName": "letters",
+                "endpointName": "poqa",
+                "parameters": {
+                    "action": {
+                        "model": "modules/letters/letter",
+                        "action": "findByPk",
+                        "parameters": [
+                            letter_id,
+                            {
+                                "include": [
+                                    {
+                                        "association": "attachments",
+                                        "required": False,
+                                        "attributes": ["id", "filename", "file", "contentType", "inline", "letterId"]
+                                    },
+                                    {
+                                        "association": "studentStatuses",
+                                        "required": True,
+                                        "where": {"studentId": {"$in": [student_id]}},
+                                        "include": [{"association": "student", "required": True}]
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    "uiState": "main.modules.letters.view.details"
+                }
+            }
+        ]
+    }
+
 
 class SimpleSchulmanagerAPI:
     """Simplified API client for testing letters functionality."""
     
+    __slots__ = ('email', 'password', 'password_bytes', 'session', 'token', 'user_data', 'cached_students')
+    
     def __init__(self, email: str, password: str, session: aiohttp.ClientSession):
         self.email = email
         self.password = password
+        self.password_bytes = password.encode('utf-8')
         self.session = session
         self.token = None
         self.user_data = {}
+        # Students restored from the token cache (IDs only); None after a full login
+        self.cached_students = None
     
     async def authenticate(self):
-        """Authenticate with the API."""
+        """Authenticate with the API (reuses a cached token when still valid)."""
+        cached = restore(self.email)
+        if cached:
+            self.token, self.cached_students = cached
+            return
+        
+        _warn_if_no_asm()
+        
         # Get salt
         salt_payload = {
             "emailOrUsername": self.email,
@@ -41,9 +125,8 @@ class SimpleSchulmanagerAPI:
                 salt = await response.text()
         
         # Generate hash
-        password_bytes = self.password.encode('utf-8')
         salt_bytes = salt.encode('utf-8')
-        hash_bytes = hashlib.pbkdf2_hmac('sha512', password_bytes, salt_bytes, 99999, dklen=512)
+        hash_bytes = hashlib.pbkdf2_hmac('sha512', self.password_bytes, salt_bytes, 99999, dklen=512)
         salted_hash = hash_bytes.hex()
         
         # Login
@@ -67,9 +150,19 @@ class SimpleSchulmanagerAPI:
             
             if not self.token:
                 raise Exception("No token received")
+            
+            remember(self.email, self.token, await self.get_students())
+    
+    def _forget_rejected_token(self, status: int) -> None:
+        """Drop the cached JWT after a 401 so the next run logs in again."""
+        if status == 401:
+            invalidate_token(self.email)
     
     async def get_students(self):
-        """Get students from user data."""
+        """Get students from user data (only their IDs when the token came from the cache)."""
+        if self.cached_students is not None:
+            return self.cached_students
+        
         students = []
         
         # Check for associated parents (parent account)
@@ -106,10 +199,17 @@ class SimpleSchulmanagerAPI:
                 {
                     "moduleName": "letters",
                     "endpointName": "get-letters"
+                },
+                # Independent of the letter ID, so it rides along with the list
+                # instead of the dependent details call
+                {
+                    "moduleName": "letters",
+                    "endpointName": "get-translation-languages"
                 }
             ]
         }
         
+        first_letter_id = None
         try:
             async with self.session.post(
                 "https://login.schulmanager-online.de/api/calls",
@@ -130,26 +230,36 @@ class SimpleSchulmanagerAPI:
                             
                             # Show first few letters
                             for i, letter in enumerate(letters[:3]):
-                                print(f"   Letter {i+1}:")
-                                print(f"     ID: {letter.get('id')}")
-                                print(f"     Subject: {letter.get('subject', 'No subject')}")
-                                print(f"     Date: {letter.get('createdAt', 'No date')}")
-                                print(f"     From: {letter.get('from', 'Unknown sender')}")
-                                print(f"     Read: {letter.get('read', 'Unknown')}")
-                                
-                                # Test letter details for first letter
-                                if i == 0 and letter.get('id'):
-                                    await self.test_letter_details(letter['id'])
+                                log(f"   Letter {i+1}:")
+                                log(f"     ID: {letter.get('id')}")
+                                log(f"     Subject: {letter.get('subject', 'No subject')}")
+                                log(f"     Date: {letter.get('createdAt', 'No date')}")
+                                log(f"     From: {letter.get('from', 'Unknown sender')}")
+                                log(f"     Read: {letter.get('read', 'Unknown')}")
+                            
+                            if letters:
+                                first_letter_id = letters[0].get('id')
                         else:
                             print(f"   ❌ Letters API error: {letters_response}")
+                        
+                        if len(data["responses"]) >= 3:
+                            languages_response = data["responses"][2]
+                            if languages_response.get("status") == 200:
+                                print(f"   🌍 Translation languages: {len(languages_response.get('data') or [])}")
                     else:
-                        print(f"   Raw response: {json.dumps(data, indent=2)}")
+                        if VERBOSE:
+                            print(f"   Raw response: {json.dumps(data, indent=2)}")
                 else:
+                    self._forget_rejected_token(response.status)
                     error_text = await response.text()
                     print(f"   ❌ Failed: {error_text}")
                     
         except Exception as e:
             print(f"   ❌ Exception: {e}")
+        
+        # The details request needs an ID from the list, so it cannot share its round-trip
+        if first_letter_id:
+            await self.test_letter_details(first_letter_id)
     
     async def test_letter_details(self, letter_id: int):
         """Test getting detailed letter information."""
@@ -169,44 +279,7 @@ class SimpleSchulmanagerAPI:
             "Content-Type": "application/json"
         }
         
-        payload = {
-            "bundleVersion": "3505280ee7",
-            "requests": [
-                {
-                    "moduleName": "letters",
-                    "endpointName": "poqa",
-                    "parameters": {
-                        "action": {
-                            "model": "modules/letters/letter",
-                            "action": "findByPk",
-                            "parameters": [
-                                letter_id,
-                                {
-                                    "include": [
-                                        {
-                                            "association": "attachments",
-                                            "required": False,
-                                            "attributes": ["id", "filename", "file", "contentType", "inline", "letterId"]
-                                        },
-                                        {
-                                            "association": "studentStatuses",
-                                            "required": True,
-                                            "where": {"studentId": {"$in": [student_id]}},
-                                            "include": [{"association": "student", "required": True}]
-                                        }
-                                    ]
-                                }
-                            ]
-                        },
-                        "uiState": "main.modules.letters.view.details"
-                    }
-                },
-                {
-                    "moduleName": "letters",
-                    "endpointName": "get-translation-languages"
-                }
-            ]
-        }
+        payload = _poqa_payload(letter_id, student_id)
         
         try:
             async with self.session.post(
@@ -225,27 +298,29 @@ class SimpleSchulmanagerAPI:
                         if letter_response.get("status") == 200:
                             letter_data = letter_response.get("data")
                             print(f"   📄 Letter Details:")
-                            print(f"     Subject: {letter_data.get('subject', 'No subject')}")
-                            print(f"     Content: {letter_data.get('content', 'No content')[:100]}...")
-                            print(f"     Created: {letter_data.get('createdAt', 'Unknown')}")
+                            log(f"     Subject: {letter_data.get('subject', 'No subject')}")
+                            log(f"     Content: {letter_data.get('content', 'No content')[:100]}...")
+                            log(f"     Created: {letter_data.get('createdAt', 'Unknown')}")
                             
                             # Check attachments
                             attachments = letter_data.get('attachments', [])
-                            print(f"     Attachments: {len(attachments)}")
+                            log(f"     Attachments: {len(attachments)}")
                             for att in attachments:
-                                print(f"       - {att.get('filename', 'Unknown file')} ({att.get('contentType', 'Unknown type')})")
+                                log(f"       - {att.get('filename', 'Unknown file')} ({att.get('contentType', 'Unknown type')})")
                             
                             # Check student status
                             student_statuses = letter_data.get('studentStatuses', [])
-                            print(f"     Student Statuses: {len(student_statuses)}")
+                            log(f"     Student Statuses: {len(student_statuses)}")
                             for status in student_statuses:
-                                print(f"       - Read: {status.get('read', 'Unknown')}")
-                                print(f"       - Confirmed: {status.get('confirmed', 'Unknown')}")
+                                log(f"       - Read: {status.get('read', 'Unknown')}")
+                                log(f"       - Confirmed: {status.get('confirmed', 'Unknown')}")
                         else:
                             print(f"   ❌ Letter details error: {letter_response}")
                     else:
-                        print(f"   Raw response: {json.dumps(data, indent=2)}")
+                        if VERBOSE:
+                            print(f"   Raw response: {json.dumps(data, indent=2)}")
                 else:
+                    self._forget_rejected_token(response.status)
                     error_text = await response.text()
                     print(f"   ❌ Failed: {error_text}")
                     
@@ -289,4 +364,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
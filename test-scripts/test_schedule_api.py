@@ -2,6 +2,7 @@
 """Test Schedule API directly to debug the 400 error."""
 
 import asyncio
+import logging
 import sys
 import os
 from datetime import datetime, date, timedelta
@@ -9,19 +10,23 @@ from datetime import datetime, date, timedelta
 # Add the parent directory to the path so we can import the API
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from custom_components.schulmanager_online.api import SchulmanagerOnlineAPI
+from custom_components.schulmanager_online.api import SchulmanagerAPI
+from http_session import close_session, get_session
+
+_LOGGER = logging.getLogger(__name__)
 
 async def test_schedule_api():
     """Test the schedule API directly."""
     print("🚀 Testing Schedule API...")
     
-    # Initialize API
-    api = SchulmanagerOnlineAPI("<schulmanager-login>", "<schulmanager-password>")
+    # Initialize API on the shared session so all calls reuse one connection
+    session = await get_session()
+    api = SchulmanagerAPI("<schulmanager-login>", "<schulmanager-password>", session)
     
     try:
         # Login
         print("🔐 Logging in...")
-        await api._login()
+        await api.authenticate()
         print("✅ Login successful")
         
         # Get students
@@ -37,71 +42,73 @@ async def test_schedule_api():
             
             # Test schedule API with different date ranges
             today = date.today()
-            
-            # Test 1: Today only
-            print(f"\n📅 Test 1: Today only ({today})")
-            try:
-                schedule = await api.get_schedule(student_id, today, today)
-                print(f"✅ Success: {len(schedule.get('data', []))} lessons")
-            except Exception as e:
-                print(f"❌ Failed: {e}")
-            
-            # Test 2: This week
             monday = today - timedelta(days=today.weekday())
             friday = monday + timedelta(days=4)
-            print(f"\n📅 Test 2: This week ({monday} to {friday})")
-            try:
-                schedule = await api.get_schedule(student_id, monday, friday)
-                print(f"✅ Success: {len(schedule.get('data', []))} lessons")
-            except Exception as e:
-                print(f"❌ Failed: {e}")
-            
-            # Test 3: Next week
             next_monday = monday + timedelta(days=7)
             next_friday = next_monday + timedelta(days=4)
-            print(f"\n📅 Test 3: Next week ({next_monday} to {next_friday})")
-            try:
-                schedule = await api.get_schedule(student_id, next_monday, next_friday)
-                print(f"✅ Success: {len(schedule.get('data', []))} lessons")
-            except Exception as e:
-                print(f"❌ Failed: {e}")
             
-            # Test 4: Raw API call to see exact error
-            print(f"\n🔍 Test 4: Raw API call")
-            try:
-                requests = [
-                    {
-                        "moduleName": "schedules",
-                        "endpointName": "get-actual-lessons",
-                        "parameters": {
-                            "student": {"id": student_id},
-                            "start": today.isoformat(),
-                            "end": (today + timedelta(days=7)).isoformat()
-                        }
+            tests = [
+                ("Test 1: Today only", today, today),
+                ("Test 2: This week", monday, friday),
+                ("Test 3: Next week", next_monday, next_friday),
+                ("Test 4: Next 7 days", today, today + timedelta(days=7)),
+            ]
+            
+            # All date ranges go out in one /api/calls batch (one round-trip)
+            requests = [
+                {
+                    "moduleName": "schedules",
+                    "endpointName": "get-actual-lessons",
+                    "parameters": {
+                        "student": student,  # full student object, as get_schedule sends it
+                        "start": start.isoformat(),
+                        "end": end.isoformat()
                     }
-                ]
-                
+                }
+                for _, start, end in tests
+            ]
+            
+            print(f"\n🔍 Sending {len(requests)} schedule requests in one batch")
+            try:
                 response = await api._make_api_call(requests)
-                print(f"✅ Raw response: {response}")
+                results = response.get("results", [])
+                print(f"✅ Got {len(results)} results")
+                
+                for (label, start, end), resp in zip(tests, results):
+                    print(f"\n📅 {label} ({start} to {end})")
+                    if resp.get("status") != 200:
+                        print(f"❌ Failed: Status {resp.get('status')}")
+                        print(f"    Error: {resp}")
+                        continue
+                    data = resp.get("data", [])
+                    print(f"✅ Success: {len(data)} lessons")
+                    if data:
+                        print(f"    Sample: {data[0] if isinstance(data, list) else data}")
+                
+                if len(results) < len(tests):
+                    print(f"\n❌ Missing results for {len(tests) - len(results)} request(s)")
                 
-                if "responses" in response:
-                    for i, resp in enumerate(response["responses"]):
-                        print(f"  Response {i}: Status {resp.get('status')}")
-                        if resp.get("status") != 200:
-                            print(f"    Error: {resp}")
-                        else:
-                            data = resp.get("data", [])
-                            print(f"    Data: {len(data)} items")
-                            if data:
-                                print(f"    Sample: {data[0] if isinstance(data, list) else data}")
+            except Exception:
+                _LOGGER.exception("❌ Batched schedule call failed")
                 
-            except Exception as e:
-                print(f"❌ Raw API call failed: {e}")
+                # Fallback: one get_schedule per range, run concurrently on the shared session
+                print("\n🔁 Retrying as individual get_schedule calls")
+                outcomes = await asyncio.gather(
+                    *(api.get_schedule(student_id, start, end) for _, start, end in tests),
+                    return_exceptions=True,
+                )
+                for (label, start, end), outcome in zip(tests, outcomes):
+                    print(f"\n📅 {label} ({start} to {end})")
+                    if isinstance(outcome, Exception):
+                        print(f"❌ Failed: {outcome}")
+                    else:
+                        print(f"✅ Success: {len(outcome.get('lessons', []))} lessons")
         
-    except Exception as e:
-        print(f"❌ Test failed: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        _LOGGER.exception("❌ Test failed")
+    finally:
+        await close_session()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(test_schedule_api())
@@ -6,21 +6,52 @@ Test Schedule API with bundleVersion parameter to fix 400 error.
 import asyncio
 import aiohttp
 import json
+import sys
 from datetime import datetime, date, timedelta
 
+from auth_cache import invalidate_token, remember, restore
+from event_loop import run
+from http_session import close_session, get_session
+from login_hash import pbkdf2_hmac
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The web client's PBKDF2 round count; used unless the salt response names one
+PBKDF2_ITERATIONS = 99999
+_ITERATION_KEYS = ("iterations", "rounds")
+# Request 1 comes first in its batch, so the first match in the body is its lesson list
+_LESSONS_MARKER = b'"lessons":['
+
+def _dumps(obj) -> bytes:
+    """Serialize a request payload straight to bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
 class SimpleSchulmanagerAPI:
     """Simplified API client for testing."""
     
     def __init__(self, email: str, password: str, session: aiohttp.ClientSession):
         self.email = email
         self.password = password
+        # PBKDF2 input, encoded once instead of on every authenticate()
+        self._password_bytes = password.encode('utf-8')
         self.session = session
         self.token = None
         self.user_data = {}
+        # Students restored from the token cache (IDs only); None after a full login
+        self.cached_students = None
     
     async def authenticate(self):
-        """Authenticate with the API."""
-        import hashlib
+        """Authenticate with the API (reuses a cached token when still valid)."""
+        cached = restore(self.email)
+        if cached:
+            self.token, self.cached_students = cached
+            return
+        self.cached_students = None
         
         # Get salt
         salt_payload = {
@@ -36,16 +67,35 @@ class SimpleSchulmanagerAPI:
             if response.status != 200:
                 raise Exception(f"Salt request failed: {response.status}")
             
-            try:
-                data = await response.json()
-                salt = data if isinstance(data, str) else data.get("salt")
-            except:
-                salt = await response.text()
+            raw = await response.read()
+            iterations = None
+            data = None
+            content_type = response.content_type
+            if content_type.startswith("application/json") or content_type.endswith("+json"):
+                try:
+                    data = json.loads(raw)
+                except ValueError:
+                    pass
+            if data is not None:
+                if isinstance(data, dict):
+                    salt = data.get("salt")
+                    iterations = next((data[k] for k in _ITERATION_KEYS if data.get(k)), None)
+                else:
+                    salt = data
+                salt_bytes = salt.encode('utf-8')
+            else:
+                # Plain-text salt: the body already is the UTF-8 bytes PBKDF2 needs
+                salt_bytes = raw
+        
+        if iterations is None:
+            print(f"   ⚠️ Salt response carries no iteration count, using default {PBKDF2_ITERATIONS}")
+            iterations = PBKDF2_ITERATIONS
         
         # Generate hash
-        password_bytes = self.password.encode('utf-8')
-        salt_bytes = salt.encode('utf-8')
-        hash_bytes = hashlib.pbkdf2_hmac('sha512', password_bytes, salt_bytes, 99999, dklen=512)
+        # Off the event loop: the iterations block for about a second
+        hash_bytes = await asyncio.get_running_loop().run_in_executor(
+            None, pbkdf2_hmac, 'sha512', self._password_bytes, salt_bytes, int(iterations), 512
+        )
         salted_hash = hash_bytes.hex()
         
         # Login
@@ -70,9 +120,14 @@ class SimpleSchulmanagerAPI:
             
             if not self.token:
                 raise Exception("No token received")
+            
+            remember(self.email, self.token, await self.get_students())
     
     async def get_students(self):
-        """Get students from user data."""
+        """Get students from user data (only their IDs when the token came from the cache)."""
+        if self.cached_students is not None:
+            return self.cached_students
+        
         students = []
         
         # Check for associated parents (parent account)
@@ -89,6 +144,101 @@ class SimpleSchulmanagerAPI:
         
         return students
 
+class TokenRejected(Exception):
+    """The API answered 401 for the bearer token."""
+
+def _write_lines(lines: list) -> None:
+    """Write one test's buffered report lines with a single stdout call."""
+    sys.stdout.write("\n".join(lines) + "\n")
+
+def schedule_request(student: dict, endpoint_name: str = "get-actual-lessons") -> dict:
+    """Build a schedules request for the fixed test window; variants differ only in these two."""
+    return {
+        "moduleName": "schedules",
+        "endpointName": endpoint_name,
+        "parameters": {
+            "student": student,
+            "start": "2025-09-08",
+            "end": "2025-09-22"
+        }
+    }
+
+async def post_calls(session: aiohttp.ClientSession, headers: dict, requests: list):
+    """POST one /api/calls payload and return (status, parsed JSON or None, raw body)."""
+    payload = {
+        "bundleVersion": "3505280ee7",
+        "requests": requests
+    }
+    async with session.post(
+        "https://login.schulmanager-online.de/api/calls",
+        data=_dumps(payload),
+        headers=headers
+    ) as response:
+        # Read the body once; diagnostics slice the bytes instead of re-serializing
+        raw = await response.read()
+        data = json.loads(raw) if response.status == 200 else None
+        return response.status, data, raw
+
+def _first_lesson_snippet(raw: bytes, limit: int = 200) -> str:
+    """Cut the start of the first lesson out of the response body instead of re-serializing it."""
+    start = raw.find(_LESSONS_MARKER)
+    if start < 0:
+        return ""
+    start += len(_LESSONS_MARKER)
+    window = memoryview(raw)[start:start + limit]
+
+    # End at the lesson's closing brace if it falls inside the window
+    depth = 0
+    in_string = escaped = False
+    end = len(window)
+    for pos, byte in enumerate(window):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif byte == 0x5C:  # backslash
+                escaped = True
+            elif byte == 0x22:  # quote
+                in_string = False
+        elif byte == 0x22:
+            in_string = True
+        elif byte == 0x7B:  # {
+            depth += 1
+        elif byte == 0x7D:  # }
+            depth -= 1
+            if depth == 0:
+                end = pos + 1
+                break
+    return str(window[:end], "utf-8", "replace")
+
+async def send_batch(session: aiohttp.ClientSession, headers: dict, requests: list):
+    """Send requests as one /api/calls batch.
+
+    Returns one result dict per request and the raw response bytes (the
+    individual bodies joined in request order when the batch had to be split).
+    """
+    status, data, raw = await post_calls(session, headers, requests)
+    print(f"   Status: {status}")
+    if status == 401:
+        # Splitting the batch cannot help when the token itself is refused
+        raise TokenRejected(raw.decode("utf-8", "replace"))
+    if status == 200:
+        print(f"   Response: {raw[:500].decode('utf-8', 'replace')}...")
+        results = data.get("results", [])
+    else:
+        # One bad request can fail the whole batch; send them separately, concurrently
+        print(f"   ❌ Batch FAILED: {raw.decode('utf-8', 'replace')}")
+        print(f"   🔁 Retrying the {len(requests)} requests individually...")
+        singles = await asyncio.gather(*(post_calls(session, headers, [r]) for r in requests))
+        results = [
+            (body.get("results") or [{}])[0] if code == 200
+            else {"status": code, "error": body_raw.decode("utf-8", "replace")}
+            for code, body, body_raw in singles
+        ]
+        raw = b"".join(body_raw for _, _, body_raw in singles)
+    
+    # Report missing results as failures
+    return results + [{}] * (len(requests) - len(results)), raw
+
 async def test_schedule_api():
     """Test the Schedule API with bundleVersion."""
     
@@ -99,182 +249,140 @@ async def test_schedule_api():
     print("📅 Testing Schulmanager Online Schedule API")
     print("=" * 50)
     
-    async with aiohttp.ClientSession() as session:
-        api = SimpleSchulmanagerAPI(email, password, session)
+    session = await get_session()
+    api = SimpleSchulmanagerAPI(email, password, session)
+    
+    try:
+        print("🔐 Authenticating...")
+        await api.authenticate()
+        print("✅ Authentication successful!")
         
-        try:
-            print("🔐 Authenticating...")
-            await api.authenticate()
-            print("✅ Authentication successful!")
-            
-            print("\n👥 Getting students...")
-            students = await api.get_students()
-            print(f"✅ Found {len(students)} students:")
-            
-            for student in students:
-                print(f"   - {student['firstname']} {student['lastname']} (ID: {student['id']})")
-            
-            if not students:
-                print("❌ No students found")
-                return False
-            
-            student = students[0]
-            student_id = student['id']
-            student_name = f"{student['firstname']} {student['lastname']}"
-            
-            print(f"\n📅 Testing Schedule API for {student_name}...")
+        print("\n👥 Getting students...")
+        students = await api.get_students()
+        print(f"✅ Found {len(students)} students:")
+        
+        for student in students:
+            print(f"   - {student.get('firstname', '?')} {student.get('lastname', '?')} (ID: {student['id']})")
+        
+        if not students:
+            print("❌ No students found")
+            return False
+        
+        student = students[0]
+        student_id = student['id']
+        student_name = f"{student.get('firstname', '?')} {student.get('lastname', '?')}"
+        
+        print(f"\n📅 Testing Schedule API for {student_name}...")
+        
+        # Test Schedule API with bundleVersion
+        # Built once and shared by the batch and any per-request retries
+        headers = {
+            "Authorization": f"Bearer {api.token}",
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
+        
+        # Test 1: Current failing request structure WITH bundleVersion
+        request1 = schedule_request({"id": student_id})
+        
+        # Test 3: Try different endpoint (only probed if test 1 fails)
+        request3 = schedule_request({"id": student_id}, "get-lessons")
+        
+        # Test 4: Compare with working Homework API
+        request4 = {
+            "moduleName": "classbook",
+            "endpointName": "get-homework",
+            "parameters": {"student": {"id": student_id}}
+        }
+        
+        print("\n📦 Sending tests 1 and 4 in one batch...")
+        (schedule_result, hw_result), raw = await send_batch(session, headers, [request1, request4])
+        
+        # Each test's lines are collected and written with one stdout call
+        out = ["\n1️⃣ Testing with bundleVersion (current structure)..."]
+        out.append(f"   Status: {schedule_result.get('status')}")
+        if schedule_result.get("status") == 200:
+            out.append(f"   ✅ SUCCESS!")
             
-            # Test Schedule API with bundleVersion
-            headers = {"Authorization": f"Bearer {api.token}"}
+            # Analyze the response
+            schedule_data = schedule_result.get('data', {})
+            out.append(f"   📊 Schedule data keys: {list(schedule_data.keys())}")
             
-            # Test 1: Current failing request structure WITH bundleVersion
-            print("\n1️⃣ Testing with bundleVersion (current structure)...")
-            payload1 = {
-                "bundleVersion": "3505280ee7",
-                "requests": [
-                    {
-                        "moduleName": "schedules",
-                        "endpointName": "get-actual-lessons",
-                        "parameters": {
-                            "student": {"id": student_id},
-                            "start": "2025-09-08",
-                            "end": "2025-09-22"
-                        }
-                    }
-                ]
-            }
+            lessons = schedule_data.get('lessons', [])
+            out.append(f"   📚 Found {len(lessons)} lessons")
             
-            async with session.post(
-                "https://login.schulmanager-online.de/api/calls",
-                json=payload1,
-                headers=headers
-            ) as response:
-                print(f"   Status: {response.status}")
-                if response.status == 200:
-                    data = await response.json()
-                    print(f"   ✅ SUCCESS! Response: {json.dumps(data, indent=2)[:500]}...")
-                    
-                    # Analyze the response
-                    results = data.get("results", [])
-                    if results:
-                        schedule_result = results[0]
-                        print(f"   📊 Schedule result status: {schedule_result.get('status')}")
-                        schedule_data = schedule_result.get('data', {})
-                        print(f"   📊 Schedule data keys: {list(schedule_data.keys())}")
-                        
-                        lessons = schedule_data.get('lessons', [])
-                        print(f"   📚 Found {len(lessons)} lessons")
-                        
-                        if lessons:
-                            print(f"   📝 First lesson: {json.dumps(lessons[0], indent=2)[:200]}...")
-                else:
-                    error_text = await response.text()
-                    print(f"   ❌ FAILED: {error_text}")
+            if lessons:
+                # Slice the received bytes; re-encode only if the server used other separators
+                snippet = _first_lesson_snippet(raw) or _dumps(lessons[0])[:200].decode('utf-8', 'replace')
+                out.append(f"   📝 First lesson: {snippet}...")
+        else:
+            out.append(f"   ❌ FAILED: {schedule_result}")
+        _write_lines(out)
+        
+        # Tests 2 and 3 only diagnose a failing test 1
+        if schedule_result.get("status") == 200:
+            print("\n2️⃣/3️⃣ ⏭️ Skipped: test 1 succeeded")
+        else:
+            if api.cached_students is not None:
+                # A cached login only knows the student ID; log in again so
+                # test 2 really sends the full student object
+                print("\n🔄 Cached login has no full student object, logging in again for test 2...")
+                invalidate_token(email)
+                await api.authenticate()
+                headers["Authorization"] = f"Bearer {api.token}"
+                student = next((full for full in await api.get_students() if full.get("id") == student_id), student)
             
             # Test 2: Try with full student object
-            print("\n2️⃣ Testing with full student object...")
-            payload2 = {
-                "bundleVersion": "3505280ee7",
-                "requests": [
-                    {
-                        "moduleName": "schedules",
-                        "endpointName": "get-actual-lessons",
-                        "parameters": {
-                            "student": student,  # Full student object
-                            "start": "2025-09-08",
-                            "end": "2025-09-22"
-                        }
-                    }
-                ]
-            }
-            
-            async with session.post(
-                "https://login.schulmanager-online.de/api/calls",
-                json=payload2,
-                headers=headers
-            ) as response:
-                print(f"   Status: {response.status}")
-                if response.status == 200:
-                    data = await response.json()
-                    print(f"   ✅ SUCCESS with full student object!")
-                else:
-                    error_text = await response.text()
-                    print(f"   ❌ FAILED: {error_text}")
-            
-            # Test 3: Try different endpoint
-            print("\n3️⃣ Testing different endpoint (get-lessons)...")
-            payload3 = {
-                "bundleVersion": "3505280ee7",
-                "requests": [
-                    {
-                        "moduleName": "schedules",
-                        "endpointName": "get-lessons",  # Different endpoint
-                        "parameters": {
-                            "student": {"id": student_id},
-                            "start": "2025-09-08",
-                            "end": "2025-09-22"
-                        }
-                    }
-                ]
-            }
-            
-            async with session.post(
-                "https://login.schulmanager-online.de/api/calls",
-                json=payload3,
-                headers=headers
-            ) as response:
-                print(f"   Status: {response.status}")
-                if response.status == 200:
-                    data = await response.json()
-                    print(f"   ✅ SUCCESS with get-lessons endpoint!")
-                else:
-                    error_text = await response.text()
-                    print(f"   ❌ FAILED: {error_text}")
+            request2 = schedule_request(student)
             
-            # Test 4: Compare with working Homework API
-            print("\n4️⃣ Testing working Homework API for comparison...")
-            payload4 = {
-                "bundleVersion": "3505280ee7",
-                "requests": [
-                    {
-                        "moduleName": "classbook",
-                        "endpointName": "get-homework",
-                        "parameters": {"student": {"id": student_id}}
-                    }
-                ]
-            }
+            print("\n📦 Probing tests 2 and 3 in one batch...")
+            (full_student_result, get_lessons_result), _ = await send_batch(session, headers, [request2, request3])
             
-            async with session.post(
-                "https://login.schulmanager-online.de/api/calls",
-                json=payload4,
-                headers=headers
-            ) as response:
-                print(f"   Status: {response.status}")
-                if response.status == 200:
-                    data = await response.json()
-                    print(f"   ✅ Homework API still works!")
-                    results = data.get("results", [])
-                    if results:
-                        hw_result = results[0]
-                        hw_data = hw_result.get('data', [])
-                        print(f"   📚 Found {len(hw_data)} homework assignments")
-                else:
-                    error_text = await response.text()
-                    print(f"   ❌ Even homework API failed: {error_text}")
-            
-            return True
+            out = ["\n2️⃣ Testing with full student object..."]
+            out.append(f"   Status: {full_student_result.get('status')}")
+            if full_student_result.get("status") == 200:
+                out.append(f"   ✅ SUCCESS with full student object!")
+            else:
+                out.append(f"   ❌ FAILED: {full_student_result}")
             
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+            out.append("\n3️⃣ Testing different endpoint (get-lessons)...")
+            out.append(f"   Status: {get_lessons_result.get('status')}")
+            if get_lessons_result.get("status") == 200:
+                out.append(f"   ✅ SUCCESS with get-lessons endpoint!")
+            else:
+                out.append(f"   ❌ FAILED: {get_lessons_result}")
+            _write_lines(out)
+        
+        out = ["\n4️⃣ Testing working Homework API for comparison..."]
+        out.append(f"   Status: {hw_result.get('status')}")
+        if hw_result.get("status") == 200:
+            out.append(f"   ✅ Homework API still works!")
+            hw_data = hw_result.get('data', [])
+            out.append(f"   📚 Found {len(hw_data)} homework assignments")
+        else:
+            out.append(f"   ❌ Even homework API failed: {hw_result}")
+        _write_lines(out)
+        
+        return True
+        
+    except TokenRejected as e:
+        # Revoked or expired cached JWT: forget it so the next run logs in again
+        invalidate_token(email)
+        print(f"❌ Token rejected (401), removed it from the cache: {e}")
+        return False
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        await close_session()
 
 if __name__ == "__main__":
     print("🧪 Schulmanager Online Schedule API Test with bundleVersion")
     print("=" * 70)
     
-    success = asyncio.run(test_schedule_api())
+    success = run(test_schedule_api())
     
     if success:
         print("\n🎉 Schedule API test completed!")